@@ -1,14 +1,42 @@
 #!/usr/bin/env python3
 import argparse
+import array
+import concurrent.futures
+import functools
+import hashlib
 import logging
+import multiprocessing
+import os
+import pickle
 import random
 import re
 import sys
 import time
 
+import numpy as np
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
 # configuration / defaults
 LETTER_ALPHABET = 'abcdefghijklmnopqrstuvwxyz'
 SPACE_CHAR = ' '
+SPACE_BYTE = ord(SPACE_CHAR)
+LETTER_LO = ord('a')
+LETTER_HI = ord('z') + 1
+# a mutating position tries a space with the odds the old shuffled
+# letters-plus-space candidate list gave it, otherwise takes a letter
+SPACE_MUT_PROB = 1.0 / (len(LETTER_ALPHABET) + 1)
+
+# module-level generator; reseeded in main() when --seed is given
+RNG = np.random.default_rng()
 
 def parse_args():
     p = argparse.ArgumentParser()
@@ -18,31 +46,69 @@ def parse_args():
     p.add_argument('--sleep', type=float, default=0.05, help='delay between frames (seconds)')
     p.add_argument('--dict', type=str, default='/usr/share/dict/ngerman', help='path to wordlist')
     p.add_argument('--seed', type=int, default=None, help='random seed (optional)')
+    p.add_argument('--jobs', type=int, default=1,
+                   help='mutation candidates tried in parallel per epoch, best one kept (1 disables the pool)')
     return p.parse_args()
 
 def setup_logging():
     logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stderr)
     return logging.getLogger('weasel')
 
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'lettermixer')
+
+EMPTY_WORDSET = frozenset()
+
+@functools.lru_cache(maxsize=4)
 def load_wordset(path, min_block):
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        raise SystemExit(f'Wordlist not found: {path}')
+    # the parsed wordset only depends on (path, mtime, min_block); cache it
+    # on disk so repeated invocations skip the regex filter over the file
+    key = hashlib.sha1(f'{path}:{mtime}:{min_block}'.encode()).hexdigest()
+    cache_file = os.path.join(CACHE_DIR, f'{key}.pkl')
+    try:
+        with open(cache_file, 'rb') as fh:
+            cached = pickle.load(fh)
+        # older caches held a bare frozenset; only reuse the current layout
+        if isinstance(cached, tuple) and len(cached) == 2:
+            return cached
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
     pat = re.compile(r'^[a-zA-Z]+$')
     wset = set()
+    with open(path, encoding='utf-8', errors='ignore') as fh:
+        for ln in fh:
+            w = ln.strip()
+            if not w:
+                continue
+            if not pat.fullmatch(w):
+                continue
+            if w.isupper():
+                continue
+            lw = w.lower()
+            if len(lw) >= min_block:
+                wset.add(lw)
+    # also index by word length: the per-length sets are much smaller than
+    # the full wordset, so the hot membership tests hit smaller hash tables
+    by_len = {}
+    for w in wset:
+        by_len.setdefault(len(w), set()).add(w)
+    result = (frozenset(wset), {ln: frozenset(ws) for ln, ws in by_len.items()})
     try:
-        with open(path, encoding='utf-8', errors='ignore') as fh:
-            for ln in fh:
-                w = ln.strip()
-                if not w:
-                    continue
-                if not pat.fullmatch(w):
-                    continue
-                if w.isupper():
-                    continue
-                lw = w.lower()
-                if len(lw) >= min_block:
-                    wset.add(lw)
-    except FileNotFoundError:
-        raise SystemExit(f'Wordlist not found: {path}')
-    return wset
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(cache_file, 'wb') as fh:
+            pickle.dump(result, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass
+    return result
+
+@functools.lru_cache(maxsize=8)
+def _bounded_letter_re(min_block):
+    # compiled once per min_block; the lookarounds fold the space/edge
+    # boundary tests into the single regex pass
+    return re.compile(rf'(?:^|(?<= ))[a-z]{{{min_block},}}(?=$| )')
 
 def random_letter():
     return random.choice(LETTER_ALPHABET)
@@ -50,52 +116,72 @@ def random_letter():
 def build_initial_string(n, min_block, space_prob=0.04):
     # build char list of length n obeying basic spacing constraints
     chars = []
+    # letters appended since the last space, maintained incrementally
+    # instead of re-scanning backwards for every appended char
+    left_since_space = 0
     while len(chars) < n:
         # avoid leading space
         if len(chars) == 0:
             chars.append(random_letter())
+            left_since_space = 1
             continue
         # avoid creating double spaces or violating min_block to end
         remaining = n - len(chars)
-        left_since_space = 0
-        for i in range(len(chars)-1, -1, -1):
-            if chars[i] == SPACE_CHAR:
-                break
-            left_since_space += 1
         can_place_space = (
             left_since_space >= min_block and
             (remaining - 1) >= min_block
         )
         if can_place_space and random.random() < space_prob:
             chars.append(SPACE_CHAR)
+            left_since_space = 0
         else:
             chars.append(random_letter())
+            left_since_space += 1
     # ensure no trailing space
     if chars[-1] == SPACE_CHAR:
         chars[-1] = random_letter()
     return ''.join(chars[:n])
 
-def find_word_matches(s, wordset, min_block):
+def build_automaton(wordset):
+    # one-time Aho-Corasick automaton over the wordlist; scanning it is a
+    # single C-level DFA pass per frame instead of regex + set lookups
+    if ahocorasick is None:
+        return None
+    auto = ahocorasick.Automaton()
+    for w in wordset:
+        auto.add_word(w, len(w))
+    auto.make_automaton()
+    return auto
+
+def find_word_matches(s, by_len, min_block, automaton=None):
     # find [a-z]{min_block,} that are bounded by start/space and end/space
     matches = []
-    for m in re.finditer(r'[a-z]{%d,}' % min_block, s):
-        start, end = m.span()
-        token = m.group()
-        left_ok = (start == 0) or (s[start-1] == SPACE_CHAR)
-        right_ok = (end == len(s)) or (s[end] == SPACE_CHAR)
-        if left_ok and right_ok and token in wordset:
-            matches.append((start, end, token))
+    if automaton is not None:
+        n = len(s)
+        for end_idx, wlen in automaton.iter(s):
+            end = end_idx + 1
+            start = end - wlen
+            left_ok = (start == 0) or (s[start-1] == SPACE_CHAR)
+            right_ok = (end == n) or (s[end] == SPACE_CHAR)
+            if left_ok and right_ok:
+                matches.append((start, end, s[start:end]))
+    else:
+        for m in _bounded_letter_re(min_block).finditer(s):
+            start, end = m.span()
+            token = m.group()
+            if token in by_len.get(end - start, EMPTY_WORDSET):
+                matches.append((start, end, token))
     # prefer longer words first to avoid overlapping freezes
     matches.sort(key=lambda t: (-(t[1]-t[0]), t[0]))
-    # keep non-overlapping
+    # keep non-overlapping; occ is a bytearray so the overlap test runs as a
+    # C-level memchr instead of a Python loop per candidate
     chosen = []
-    occ = [False] * len(s)
+    occ = bytearray(len(s))
     for start, end, tok in matches:
-        if any(occ[i] for i in range(start, end)):
+        if occ.find(1, start, end) != -1:
             continue
         chosen.append((start, end, tok))
-        for i in range(start, end):
-            occ[i] = True
+        occ[start:end] = b'\x01' * (end - start)
     return chosen
 
 def freeze_matrix_from_matches(n, matches):
@@ -150,183 +236,271 @@ def freeze_matrix_from_matches(n, matches):
     # Because above got messy, simplify: return frozen, word_id, words; freezing adjacent spaces will be done by caller.
     return frozen, word_id, words
 
-def freeze_flags_with_adjacent_spaces(s, frozen, word_id, matches):
+def unfrozen_gaps(frozen):
+    # maximal [start, end) runs of unfrozen positions; the scan for the next
+    # frozen flag is a C-level find on the bytearray
+    gaps = []
+    n = len(frozen)
+    i = 0
+    while i < n:
+        if frozen[i]:
+            i += 1
+            continue
+        j = frozen.find(1, i)
+        if j == -1:
+            j = n
+        gaps.append((i, j))
+        i = j
+    return gaps
+
+def find_new_word_matches(s, by_len, min_block, frozen, automaton=None):
+    # frozen positions never unfreeze, and locked words are insulated by
+    # frozen spaces (or the string edges), so new words can only appear in
+    # the unfrozen gaps -- scan just those substrings
+    new = []
+    for a, b in unfrozen_gaps(frozen):
+        for start, end, tok in find_word_matches(s[a:b], by_len, min_block, automaton):
+            new.append((start + a, end + a, tok))
+    return new
+
+def freeze_flags_with_adjacent_spaces(s, frozen, word_id, matches, wid_base=0):
     n = len(s)
-    for wid, (start, end, tok) in enumerate(matches):
+    for wid, (start, end, tok) in enumerate(matches, wid_base):
         # freeze word letters
         for i in range(start, end):
-            frozen[i] = True
+            frozen[i] = 1
             word_id[i] = wid
         # freeze space immediately before the word, falls vorhanden
         if start - 1 >= 0 and s[start - 1] == SPACE_CHAR:
-            frozen[start - 1] = True
+            frozen[start - 1] = 1
             word_id[start - 1] = wid
         # freeze space immediately after the word, falls vorhanden
         if end < n and s[end] == SPACE_CHAR:
-            frozen[end] = True
+            frozen[end] = 1
             word_id[end] = wid
     return frozen, word_id
 
-def can_place_space_at(s_chars, idx, frozen, min_block):
-    n = len(s_chars)
+def compute_run_profiles(state, frozen_arr):
+    # per-position letter-run lengths to the previous/next space plus the
+    # number of frozen chars inside each run, all from vectorized prefix
+    # passes -- makes the space feasibility check O(1) per candidate
+    n = len(state)
+    is_space = state == SPACE_BYTE
+    idx = np.arange(n)
+    prev_space = np.concatenate(([-1], np.maximum.accumulate(np.where(is_space, idx, -1))[:-1]))
+    ns_here = np.minimum.accumulate(np.where(is_space, idx, n)[::-1])[::-1]
+    next_space = np.concatenate((ns_here[1:], [n]))
+    left_run = idx - prev_space - 1
+    right_run = next_space - idx - 1
+    fcum = np.concatenate(([0], np.cumsum(np.asarray(frozen_arr, dtype=np.intp))))
+    frozen_left = fcum[idx] - fcum[prev_space + 1]
+    frozen_right = fcum[next_space] - fcum[idx + 1]
+    return left_run, right_run, frozen_left, frozen_right
+
+def can_place_space_at(state, idx, runs, min_block):
+    # a space at idx must not touch the edges, must not create double
+    # spaces, must leave min_block letters on both sides and must not split
+    # a run containing frozen chars
+    n = len(state)
     if idx == 0 or idx == n - 1:
         return False
-    if s_chars[idx-1] == SPACE_CHAR or s_chars[idx] == SPACE_CHAR:
-        # if we're testing to set idx to space, ensure not double space with left/current
-        if s_chars[idx-1] == SPACE_CHAR:
-            return False
-    # measure left letters until previous space
-    left = 0
-    j = idx - 1
-    while j >= 0 and s_chars[j] != SPACE_CHAR:
-        left += 1
-        j -= 1
-    right = 0
-    k = idx + 1
-    while k < n and s_chars[k] != SPACE_CHAR:
-        right += 1
-        k += 1
-    if left >= min_block and right >= min_block:
-        return True
-    return False
+    if state[idx-1] == SPACE_BYTE or state[idx+1] == SPACE_BYTE:
+        return False
+    left_run, right_run, frozen_left, frozen_right = runs
+    return (left_run[idx] >= min_block and right_run[idx] >= min_block
+            and frozen_left[idx] == 0 and frozen_right[idx] == 0)
 
-def mutate_once(s, frozen, word_id, min_block, mutrate):
-    n = len(s)
-    chars = list(s)
-    # precompute next/prev frozen-space to help rules (not strictly necessary)
-    # perform per-position mutation
-    for i in range(n):
-        if frozen[i]:
-            continue
-        if random.random() >= mutrate:
-            continue
-        # choose uniformly among letters + space
-        candidates = list(LETTER_ALPHABET) + [SPACE_CHAR]
-        random.shuffle(candidates)
-        chosen = None
-        # try up to some attempts to pick candidate that preserves constraints
-        attempts = 0
-        for cand in candidates:
-            attempts += 1
-            if attempts > 40:
-                break
-            # candidate cannot be leading/trailing space
-            if cand == SPACE_CHAR and (i == 0 or i == n - 1):
+if numba is not None:
+    @numba.njit(cache=True, nogil=True)
+    def _mutate_kernel(state, frozen, mask, space_try, new_letters, min_block):
+        # fused mutation pass: feasibility scan and character writes happen
+        # in one machine-code loop, no interpreter dispatch per position
+        n = state.shape[0]
+        for i in range(n):
+            if not mask[i]:
                 continue
-            # cannot create double spaces
-            left = chars[i-1] if i-1 >= 0 else None
-            right = chars[i+1] if i+1 < n else None
-            if cand == SPACE_CHAR:
-                if left == SPACE_CHAR or right == SPACE_CHAR:
-                    continue
-                # ensure min_block on both sides if we place a space here
-                # count left letters
-                lcount = 0
-                j = i - 1
-                while j >= 0 and chars[j] != SPACE_CHAR:
-                    lcount += 1
-                    j -= 1
-                rcount = 0
-                k = i + 1
-                while k < n and chars[k] != SPACE_CHAR:
-                    rcount += 1
-                    k += 1
-                if lcount < min_block or rcount < min_block:
-                    continue
-                # also ensure we're not placing inside a frozen word zone such that it would split it
-                # if any frozen char exists within left or right runs, disallow changing to space
+            if space_try[i] and 0 < i < n - 1 and state[i-1] != SPACE_BYTE and state[i+1] != SPACE_BYTE:
+                ok = True
+                left = 0
                 j = i - 1
-                while j >= 0 and chars[j] != SPACE_CHAR:
+                while j >= 0 and state[j] != SPACE_BYTE:
                     if frozen[j]:
+                        ok = False
                         break
+                    left += 1
                     j -= 1
-                else:
-                    j = -1
-                if j != -1:
-                    continue
-                k = i + 1
-                while k < n and chars[k] != SPACE_CHAR:
-                    if frozen[k]:
-                        break
-                    k += 1
-                else:
-                    k = n
-                if k != n:
-                    continue
-                chosen = cand
-                break
-            else:
-                # letter candidate: always allowed (but must be lowercase)
-                chosen = cand
-                break
-        if chosen is None:
-            # fallback: place letter (keep current or random)
-            chosen = random.choice(LETTER_ALPHABET)
-        chars[i] = chosen
-    return ''.join(chars)
+                if ok:
+                    right = 0
+                    k = i + 1
+                    while k < n and state[k] != SPACE_BYTE:
+                        if frozen[k]:
+                            ok = False
+                            break
+                        right += 1
+                        k += 1
+                    if ok and left >= min_block and right >= min_block:
+                        state[i] = SPACE_BYTE
+                        continue
+            state[i] = new_letters[i]
+
+    @numba.njit(cache=True, nogil=True)
+    def _letter_kernel(state, mask, new_letters, lo, hi):
+        # elementwise letter writes for one chunk; nogil so chunks of a wide
+        # string can run on separate threads concurrently
+        for i in range(lo, hi):
+            if mask[i]:
+                state[i] = new_letters[i]
+else:
+    _mutate_kernel = None
+    _letter_kernel = None
+
+# below this size the thread pool costs more than the letter writes it splits
+PARALLEL_MIN_N = 1 << 16
+
+def mutate_once(s, frozen, word_id, min_block, mutrate):
+    n = len(s)
+    # the uint8 view aliases the bytearray, so kernel writes land directly
+    # in buf and the result is one decode away -- no copy/tobytes round-trip
+    buf = bytearray(s, 'ascii')
+    state = np.frombuffer(buf, dtype=np.uint8)
+    frozen_arr = np.asarray(frozen, dtype=bool)
+    # one batched draw decides which unfrozen positions mutate this frame
+    mask = (RNG.random(n) < mutrate) & ~frozen_arr
+    new_letters = RNG.integers(LETTER_LO, LETTER_HI, size=n, dtype=np.uint8)
+    # spaces are rare; they get their own batched roll, and the min_block
+    # constraints see spaces already placed earlier in the same frame
+    space_try = mask & (RNG.random(n) < SPACE_MUT_PROB)
+    if _mutate_kernel is not None:
+        if n >= PARALLEL_MIN_N:
+            # wide string: place the (rare) spaces serially first, since
+            # their feasibility scans read the neighborhood, then split the
+            # elementwise letter writes across threads -- the nogil kernels
+            # release the GIL so the chunks genuinely run in parallel
+            _mutate_kernel(state, frozen_arr, space_try, space_try, new_letters, min_block)
+            letter_mask = mask & ~space_try
+            workers = os.cpu_count() or 1
+            bounds = np.linspace(0, n, workers + 1).astype(np.intp)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
+                futures = [ex.submit(_letter_kernel, state, letter_mask, new_letters,
+                                     bounds[c], bounds[c+1])
+                           for c in range(workers)]
+                for fut in futures:
+                    fut.result()
+        else:
+            _mutate_kernel(state, frozen_arr, mask, space_try, new_letters, min_block)
+        return buf.decode('ascii')
+    runs = compute_run_profiles(state, frozen_arr)
+    for i in np.flatnonzero(space_try):
+        if can_place_space_at(state, i, runs, min_block):
+            state[i] = SPACE_BYTE
+            mask[i] = False
+            # a placed space splits its run; refresh the profiles (rare)
+            runs = compute_run_profiles(state, frozen_arr)
+    state[mask] = new_letters[mask]
+    return buf.decode('ascii')
 
 def render_colored(s, frozen, word_id):
     # color locked words (and their frozen spaces) green, others default
     GREEN = '\033[92m'
     RESET = '\033[0m'
+    if not s:
+        return s
+    # segment boundaries are wherever the word id changes (unfrozen runs all
+    # share the -1 sentinel), found in one np.diff pass instead of a
+    # char-by-char walk
+    wid_arr = np.frombuffer(word_id, dtype=np.intc)
+    bounds = np.flatnonzero(np.diff(wid_arr)) + 1
     out = []
-    n = len(s)
-    i = 0
-    while i < n:
-        if frozen[i]:
-            wid = word_id[i]
-            # gather contiguous region with same word_id (or frozen but None)
-            j = i
-            while j < n and frozen[j] and word_id[j] == wid:
-                j += 1
-            segment = s[i:j]
+    prev = 0
+    for b in (*bounds, len(s)):
+        segment = s[prev:b]
+        if wid_arr[prev] != -1:
             out.append(GREEN + segment + RESET)
-            i = j
         else:
-            out.append(s[i])
-            i += 1
+            out.append(segment)
+        prev = b
     return ''.join(out)
 
-def all_tokens_valid(s, wordset, min_block):
-    toks = re.findall(r'[a-z]{%d,}' % min_block, s)
-    if not toks:
-        return False
-    return all(t in wordset for t in toks)
+# per-worker state for the --jobs pool, set once by the initializer so the
+# wordset is not re-pickled with every task
+_POOL_BY_LEN = None
+_POOL_MIN_BLOCK = None
+_POOL_AUTOMATON = None
+
+def _pool_init(wordset, by_len, min_block):
+    global _POOL_BY_LEN, _POOL_MIN_BLOCK, _POOL_AUTOMATON
+    _POOL_BY_LEN = by_len
+    _POOL_MIN_BLOCK = min_block
+    _POOL_AUTOMATON = build_automaton(wordset)
+
+def _mutate_and_score(task):
+    global RNG
+    s, frozen_bytes, mutrate, seed = task
+    RNG = np.random.default_rng(seed)
+    cand = mutate_once(s, bytearray(frozen_bytes), None, _POOL_MIN_BLOCK, mutrate)
+    matches = find_word_matches(cand, _POOL_BY_LEN, _POOL_MIN_BLOCK, _POOL_AUTOMATON)
+    # score: letters locked into dictionary words
+    return sum(end - start for start, end, _ in matches), cand
 
 def main():
+    global RNG
     args = parse_args()
     if args.seed is not None:
         random.seed(args.seed)
+        RNG = np.random.default_rng(args.seed)
     logger = setup_logging()
-    wordset = load_wordset(args.dict, args.min_block)
+    wordset, by_len = load_wordset(args.dict, args.min_block)
     if not wordset:
         raise SystemExit("No words loaded for given min_block; adjust dictionary or min-block.")
+    automaton = build_automaton(wordset)
+    pool = None
+    if args.jobs > 1:
+        pool = multiprocessing.Pool(args.jobs, initializer=_pool_init,
+                                    initargs=(wordset, by_len, args.min_block))
 
     s = build_initial_string(args.n, args.min_block, space_prob=0.04)
     n = len(s)
-    # initial frozen matrix: all False
-    frozen = [False] * n
-    word_id = [None] * n
+    # frozen flags live in a bytearray (1 byte/char); word ids in an int
+    # array with -1 as the "no word" sentinel. Both persist across epochs:
+    # frozen positions never unfreeze, so only new matches are merged in.
+    frozen = bytearray(n)
+    word_id = array.array('i', [-1]) * n
+    words = []
     # epoch counter
     epoch = 0
 
     try:
         while True:
-            # detect matches and freeze them (and adjacent spaces)
-            matches = find_word_matches(s, wordset, args.min_block)
-            frozen, word_id = [False]*n, [None]*n
-            frozen, word_id = freeze_flags_with_adjacent_spaces(s, frozen, word_id, matches)
+            # detect new matches in the unfrozen gaps and freeze them (and
+            # their adjacent spaces) on top of the existing flags
+            matches = find_new_word_matches(s, by_len, args.min_block, frozen, automaton)
+            if matches:
+                frozen, word_id = freeze_flags_with_adjacent_spaces(
+                    s, frozen, word_id, matches, wid_base=len(words))
+                words.extend(matches)
 
             # display
             sys.stdout.write('\033[H\033[J')
             print(render_colored(s, frozen, word_id))
-            # termination: if all tokens of len>=min_block are dictionary words
-            if all_tokens_valid(s, wordset, args.min_block):
+            # termination: the accumulated matches already say which letters
+            # are locked into dictionary words; once they cover every letter
+            # position there is nothing left to validate
+            covered = sum(end - start for start, end, _ in words)
+            if covered == n - s.count(SPACE_CHAR):
                 logger.info("All tokens are dictionary words; finished.")
                 break
 
-            # mutate unfrozen positions (letters and spaces)
-            s = mutate_once(s, frozen, word_id, args.min_block, args.mutrate)
+            # mutate unfrozen positions (letters and spaces); skip the pass
+            # entirely when everything is already frozen
+            if sum(frozen) < n:
+                if pool is not None:
+                    # try several mutations in parallel and keep the one that
+                    # locks the most letters into dictionary words
+                    tasks = [(s, bytes(frozen), args.mutrate, int(RNG.integers(2**63)))
+                             for _ in range(args.jobs)]
+                    s = max(pool.map(_mutate_and_score, tasks))[1]
+                else:
+                    s = mutate_once(s, frozen, word_id, args.min_block, args.mutrate)
 
             epoch += 1
             time.sleep(args.sleep)
@@ -336,6 +510,9 @@ def main():
         print("Final string (locked words highlighted):")
         print(render_colored(s, frozen, word_id))
         sys.exit(0)
+    finally:
+        if pool is not None:
+            pool.terminate()
 
 if __name__ == '__main__':
     main()